@@ -23,6 +23,8 @@
 # SOFTWARE.
 # ==============================================================================
 
+import asyncio
+import functools
 from typing import Optional, Union, List, Dict
 
 from requests import Response
@@ -137,7 +139,7 @@ class GenerativeAI(Logging):
             return None
         data = utf8_encode(string=json_encode(obj=info))
         url = '/v1beta/models/gemini-pro:generateContent?key=%s' % self.__auth_token
-        response = self.http_post(url=url, headers={
+        post = functools.partial(self.http_post, url=url, headers={
             'Content-Type': 'application/json',
             # 'Authorization': self.__auth_token,
             'Origin': self.REFERER_URL,
@@ -146,6 +148,9 @@ class GenerativeAI(Logging):
                           ' AppleWebKit/537.36 (KHTML, like Gecko)'
                           ' Chrome/116.0.0.0 Safari/537.36',
         }, data=data)
+        # blocking I/O, run it in the executor to let other users chat at the same time
+        loop = asyncio.get_running_loop()
+        response = await loop.run_in_executor(None, post)
         # show_response(response=response)
         info = parse_response(text=response.text)
         if info is None:
@@ -23,9 +23,11 @@
 # SOFTWARE.
 # ==============================================================================
 
-# import random
+import asyncio
 import threading
-from typing import Optional, List, Dict
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Optional, Callable, Awaitable, List, Set, Dict, Tuple
 
 from dimples import DateTime
 from dimples import ID
@@ -33,7 +35,7 @@ from dimples import Content
 from dimples import TextContent
 from dimples import CommonFacebook
 
-from ...utils import Singleton, Runner
+from ...utils import Singleton
 from ...chat import Request, ChatRequest
 from ...chat import ChatBox, VideoBox, ChatClient
 from ...chat import ChatContext
@@ -46,66 +48,104 @@ from .engine import Task, Engine
 from .engine import KeywordManager
 
 
+# engine searching in current context, with the function to claim the winner
+_RACER: ContextVar[Optional[Tuple[Engine, Callable[[Engine], bool]]]] = ContextVar('search_racer', default=None)
+
+
 class SearchBox(VideoBox):
 
     def __init__(self, identifier: ID, facebook: CommonFacebook, proxy: ChatProxy):
         super().__init__(identifier=identifier, facebook=facebook, proxy=proxy)
         self.__task: Optional[Task] = None
-        self.__lock = threading.Lock()
+        self.__lock = asyncio.Lock()
+        # background searching
+        self.__bg: Optional[asyncio.Task] = None
 
-    def cancel_task(self):
-        with self.__lock:
-            self._cancel_task()
+    async def cancel_task(self):
+        async with self.__lock:
+            await self._cancel_task()
 
-    def _cancel_task(self):
+    async def _cancel_task(self):
         task = self.__task
         if task is not None:
             self.__task = None
             self.warning(msg='cancelling task')
             task.cancel()
-
-    def new_task(self, keywords: str, request: ChatRequest) -> Task:
-        with self.__lock:
+        bg = self.__bg
+        if bg is not None and bg is not asyncio.current_task():
+            self.__bg = None
+            bg.cancel()
+            # wait for the cancelled task to stop
+            await asyncio.gather(bg, return_exceptions=True)
+
+    async def new_task(self, keywords: str, request: ChatRequest) -> Task:
+        async with self.__lock:
             task = Task(keywords=keywords, request=request, box=self)
-            self._cancel_task()
+            await self._cancel_task()
             self.__task = task
             return task
 
-    # Override
-    def report_success(self, service: str, agent: str):
-        monitor = Monitor()
-        monitor.report_success(service=service, agent=agent)
-
-    # Override
-    def report_failure(self, service: str, agent: str):
-        monitor = Monitor()
-        monitor.report_failure(service=service, agent=agent)
-
-    # Override
-    def report_crash(self, service: str):
-        monitor = Monitor()
-        monitor.report_crash(service=service)
-
     # Override
     async def process_request(self, request: Request) -> Optional[ChatProcessor]:
         coro = super().process_request(request=request)
-        # searching in background
-        thr = Runner.async_thread(coro=coro)
-        thr.start()
+        # processing in background, so that a new prompt can stop the previous one;
+        # the chat client keeps waiting for it, it still counts as a processing request
+        async with self.__lock:
+            if _is_prompt(request=request):
+                # cancel the previous searching right now, in the order of requests
+                await self._cancel_task()
+                bg = self.__bg = self._run_background(coro=coro)
+            else:
+                bg = self._run_background(coro=coro)
+            bg.add_done_callback(self._task_done)
         # FIXME:
         return None
 
+    def _task_done(self, task: asyncio.Task):
+        if self.__bg is task:
+            self.__bg = None
+        if not task.cancelled():
+            error = task.exception()
+            if error is not None:
+                self.error(msg='failed to process request in background: %s, %s' % (error, self))
+
     # Override
     async def _send_content(self, content: Content, receiver: ID):
+        racer = _RACER.get()
+        if racer is not None:
+            engine, claim = racer
+            if not claim(engine):
+                # another engine has responded first
+                self.warning(msg='drop response from engine: %s' % engine)
+                return False
         emitter = Emitter()
         return await emitter.send_content(content=content, receiver=receiver)
 
 
+def _is_prompt(request: Request) -> bool:
+    if isinstance(request, ChatRequest):
+        text = request.text
+        return text is not None and len(text.strip()) > 0
+
+
 class SearchHandler(ChatProcessor):
 
-    def __init__(self, engine: Engine):
-        super().__init__(agent=engine.agent)
-        self.__engine = engine
+    def __init__(self, service: str):
+        super().__init__(agent='SearchEngine')
+        self.__service = service
+        # shared by all search boxes
+        self.__engines: Tuple[Engine, ...] = ()
+
+    @property
+    def service(self) -> str:
+        return self.__service  # 'TV_MOV'
+
+    @property
+    def engines(self) -> Tuple[Engine, ...]:
+        return self.__engines
+
+    def add_engine(self, engine: Engine):
+        self.__engines = (*self.__engines, engine)
 
     # Override
     async def _query(self, prompt: str, content: TextContent, request: ChatRequest, context: ChatContext) -> bool:
@@ -115,10 +155,16 @@ class SearchHandler(ChatProcessor):
         #
         sender = request.envelope.sender
         group = request.content.group
-        nickname = await get_nickname(identifier=sender, facebook=context.facebook)
+        facebook = context.facebook
+        if group is None:
+            nickname = await get_nickname(identifier=sender, facebook=facebook)
+            name = None
+        else:
+            # query names of sender & group at the same time
+            nickname, name = await asyncio.gather(get_nickname(identifier=sender, facebook=facebook),
+                                                  get_nickname(identifier=group, facebook=facebook))
         source = '"%s" %s' % (nickname, sender)
         if group is not None:
-            name = await get_nickname(identifier=group, facebook=context.facebook)
             if name is None or len(name) == 0:
                 source += ' (%s)' % group
             else:
@@ -128,26 +174,21 @@ class SearchHandler(ChatProcessor):
         #  1. check keywords
         #
         keywords = prompt.strip()
-        kw_len = len(keywords)
-        if kw_len == 0:
+        if len(keywords) == 0:
             return True
         else:
-            context.cancel_task()
+            await context.cancel_task()
             # save command in history
-            his_man = HistoryManager()
-            his_man.add_command(cmd=keywords, when=request.time, sender=sender, group=group)
+            _HISTORY.add_command(cmd=keywords, when=request.time, sender=sender, group=group)
         # system commands
-        if kw_len == 6 and keywords.lower() == 'cancel':
-            return True
-        elif kw_len == 4 and keywords.lower() == 'stop':
-            return True
-        elif kw_len == 12 and keywords.lower() == 'show history':
-            await _respond_history(history=his_man.commands, request=request, box=context)
-            return True
+        if _COMMAND_MIN_LEN <= len(keywords) <= _COMMAND_MAX_LEN:
+            handler = _COMMAND_TABLE.get(keywords.lower())
+            if handler is not None:
+                return await handler(request, context)
         #
         #  2. search
         #
-        task = context.new_task(keywords=keywords, request=request)
+        task = await context.new_task(keywords=keywords, request=request)
         coro = self._search(task=task, box=context)
         # searching in background
         return await coro
@@ -155,41 +196,110 @@ class SearchHandler(ChatProcessor):
         # thr.start()
         # return True
 
+    # protected
+    def _move_engine(self, index: int, engine: Engine):
+        if index > 0:
+            self.warning(msg='move engine position: %d, %s' % (index, engine))
+            others = tuple(item for item in self.__engines if item is not engine)
+            self.__engines = (engine, *others)
+
     async def _search(self, task: Task, box: SearchBox) -> bool:
-        engine = self.__engine
-        # try to search by engine
-        try:
-            code = await engine.search(task=task)
+        all_engines = self.__engines
+        if len(all_engines) == 0:
+            self.error(msg='search engines not set')
+            return False
+        # engines are reported here one by one, not by the proxy
+        service = self.service
+        monitor = Monitor()
+        report_success = monitor.report_success
+        report_failure = monitor.report_failure
+        cancelled = Engine.CANCELLED_CODE  # -205
+        results: List[Tuple[Engine, int]] = []
+        futures: Dict[Engine, asyncio.Future] = {}
+        winner: Optional[Engine] = None
+
+        def claim(engine: Engine) -> bool:
+            """ The first engine responding wins, and only the winner can talk to the user """
+            nonlocal winner
+            if winner is None:
+                winner = engine
+                # stop the other engines
+                for item, fut in futures.items():
+                    if item is not engine:
+                        fut.cancel()
+            return winner is engine
+
+        async def try_engine(engine: Engine):
+            _RACER.set((engine, claim))
+            try:
+                code = await engine.search(task=task)
+            except Exception as error:
+                self.error(msg='failed to search: %s, %s, error: %s' % (task, engine, error))
+                report_failure(service=service, agent=engine.agent)
+                return
+            results.append((engine, code))
+            if code > 0:
+                # found without responding anything
+                claim(engine)
+
+        # try to search by all engines concurrently
+        if hasattr(asyncio, 'TaskGroup'):
+            # Python 3.11+, all engines will be awaited when leaving the group,
+            # errors are caught in 'try_engine()', so one engine won't break the others
+            async with asyncio.TaskGroup() as group:
+                for item in all_engines:
+                    futures[item] = group.create_task(try_engine(engine=item))
+        else:
+            for item in all_engines:
+                futures[item] = asyncio.ensure_future(try_engine(engine=item))
+            try:
+                await asyncio.gather(*futures.values(), return_exceptions=True)
+            finally:
+                # make sure no engine left running
+                for fut in futures.values():
+                    fut.cancel()
+                await asyncio.gather(*futures.values(), return_exceptions=True)
+        # report results
+        for engine, code in results:
             if code > 0:
-                return True
-        except Exception as error:
-            self.error(msg='failed to search: %s, %s, error: %s' % (task, engine, error))
+                report_success(service=service, agent=engine.agent)
+            elif code != cancelled:
+                report_failure(service=service, agent=engine.agent)
+        if any(engine is winner and code > 0 for engine, code in results):
+            # move this engine to the front
+            self._move_engine(index=all_engines.index(winner), engine=winner)
             return True
-        # check error code
-        if code == 0:
-            key_man = KeywordManager()
-            await _respond_204(history=key_man.keywords, keywords=task.keywords, request=task.request, box=box)
-        elif code != Engine.CANCELLED_CODE:  # code != -205:
-            self.error(msg='search error from engine: %d %s' % (code, engine))
+        # check error codes
+        failed = sum(code < 0 and code != cancelled for _, code in results)
+        if failed > 0:
+            self.error(msg='search error from %d engine(s): %s, %s' % (failed, task, results))
+        if any(code == 0 for _, code in results):
+            await _respond_204(history=_KEYWORDS.keywords, keywords=task.keywords, request=task.request, box=box)
+        elif not task.cancelled:
+            monitor.report_crash(service=service)
+        return False
 
 
 async def _respond_204(history: List[str], keywords: str, request: ChatRequest, box: VideoBox):
     if history is None:
         history = []
-    text = 'No contents for **"%s"**, you can try the following keywords:\n' % keywords
-    text += '\n----\n'
-    for his in history:
-        text += '- **%s**\n' % his
-    text += '\n'
-    text += 'You can also input this command to scan TV channels:\n'
-    text += '\n- **TV channels**'
+    body = ''.join('- **%s**\n' % his for his in history)
+    text = 'No contents for **"%s"**, you can try the following keywords:\n' \
+           '\n----\n' \
+           '%s\n' \
+           'You can also input this command to scan TV channels:\n' \
+           '\n- **TV channels**' % (keywords, body)
     return await box.respond_markdown(text=text, request=request)
 
 
 async def _respond_history(history: List[Dict], request: ChatRequest, box: VideoBox):
-    text = 'Search history:\n'
-    text += '| From | Keyword | Time |\n'
-    text += '|------|---------|------|\n'
+    parts = [
+        'Search history:\n',
+        '| From | Keyword | Time |\n',
+        '|------|---------|------|\n',
+    ]
+    rows: List[Tuple[ID, Optional[ID], str, DateTime]] = []
+    unique_ids: Set[ID] = set()
     for his in history:
         sender = his.get('sender')
         group = his.get('group')
@@ -198,31 +308,75 @@ async def _respond_history(history: List[Dict], request: ChatRequest, box: Video
         assert sender is not None and cmd is not None, 'history error: %s' % his
         sender = ID.parse(identifier=sender)
         group = ID.parse(identifier=group)
-        user = '**"%s"**' % await box.get_name(identifier=sender)
+        unique_ids.add(sender)
         if group is not None:
-            user += ' (%s)' % await box.get_name(identifier=group)
-        text += '| %s | %s | %s |\n' % (user, cmd, when)
-    return await box.respond_markdown(text=text, request=request)
+            unique_ids.add(group)
+        rows.append((sender, group, cmd, when))
+    # get names for all users & groups at the same time
+    ids = list(unique_ids)
+    names: Dict[ID, str] = dict(zip(ids, await asyncio.gather(*[box.get_name(identifier=i) for i in ids])))
+    for sender, group, cmd, when in rows:
+        user = '**"%s"**' % names[sender]
+        if group is not None:
+            user += ' (%s)' % names[group]
+        parts.append('| %s | %s | %s |\n' % (user, cmd, when))
+    return await box.respond_markdown(text=''.join(parts), request=request)
+
+
+#
+#   System Commands
+#
+
+
+async def _cmd_cancel(request: ChatRequest, box: SearchBox) -> bool:
+    # the previous task was already cancelled
+    return True
+
+
+async def _cmd_show_history(request: ChatRequest, box: SearchBox) -> bool:
+    sender = request.envelope.sender
+    await _respond_history(history=_HISTORY.commands_for(sender=sender), request=request, box=box)
+    return True
+
+
+_COMMAND_TABLE: Dict[str, Callable[[ChatRequest, SearchBox], Awaitable[bool]]] = {
+    'cancel': _cmd_cancel,
+    'stop': _cmd_cancel,
+    'show history': _cmd_show_history,
+}
+
+# prompts out of this range are not commands, search them directly
+_COMMAND_MIN_LEN = min(len(cmd) for cmd in _COMMAND_TABLE)
+_COMMAND_MAX_LEN = max(len(cmd) for cmd in _COMMAND_TABLE)
 
 
 @Singleton
 class HistoryManager:
 
-    MAX_LENGTH = 50
+    MAX_LENGTH = 50   # commands for each sender
+    MAX_SENDERS = 1024
 
     def __init__(self):
         super().__init__()
-        self.__commands: List[Dict] = []
+        # sender => bounded queue, the oldest command will be dropped automatically;
+        # senders are kept in LRU order, the least recent one will be removed when full
+        self.__commands: Dict[ID, deque] = OrderedDict()
         self.__lock = threading.Lock()
 
-    @property
-    def commands(self) -> List[Dict]:
-        with self.__lock:
-            return self.__commands.copy()
+    def commands_for(self, sender: ID) -> List[Dict]:
+        commands = self.__commands.get(sender)
+        return [] if commands is None else list(commands)
 
     def add_command(self, cmd: str, when: DateTime, sender: ID, group: Optional[ID]):
         with self.__lock:
-            self.__commands.append({
+            commands = self.__commands.get(sender)
+            if commands is None:
+                commands = self.__commands[sender] = deque(maxlen=self.MAX_LENGTH)
+                if len(self.__commands) > self.MAX_SENDERS:
+                    self.__commands.popitem(last=False)
+            else:
+                self.__commands.move_to_end(sender)
+            commands.append({
                 'sender': sender,
                 'group': group,
                 'when': when,
@@ -230,24 +384,24 @@ class HistoryManager:
             })
 
 
+# shared managers
+_HISTORY = HistoryManager()
+_KEYWORDS = KeywordManager()
+
+
 class SearchClient(ChatClient):
 
     def __init__(self, facebook: CommonFacebook):
         super().__init__()
         self.__facebook = facebook
-        self.__engines: List[Engine] = []
+        self.__handler = SearchHandler(service='TV_MOV')
 
     def add_engine(self, engine: Engine):
-        self.__engines.append(engine)
+        self.__handler.add_engine(engine=engine)
 
     # Override
     def _new_box(self, identifier: ID) -> Optional[ChatBox]:
         facebook = self.__facebook
-        processors = []
-        for engine in self.__engines:
-            processors.append(SearchHandler(engine=engine))
-        # count = len(processors)
-        # if count > 1:
-        #     processors = random.sample(processors, count)
-        proxy = ChatProxy(service='TV_MOV', processors=processors)
+        handler = self.__handler
+        proxy = ChatProxy(service=handler.service, processors=[handler])
         return SearchBox(identifier=identifier, facebook=facebook, proxy=proxy)
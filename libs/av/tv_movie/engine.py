@@ -23,9 +23,11 @@
 # SOFTWARE.
 # ==============================================================================
 
+import asyncio
 import threading
 from abc import abstractmethod
-from typing import Optional, List
+from types import MappingProxyType
+from typing import Optional, List, Mapping
 
 from dimples import URI
 
@@ -92,6 +94,19 @@ class Engine(Logging):
 
     CANCELLED_CODE = -205
 
+    # common request headers, read-only ('Referer' will be added for each request)
+    COMMON_HEADERS: Mapping[str, str] = MappingProxyType({
+        'Accept': '*/*',
+        # 'Accept-Encoding': 'gzip, deflate, br',
+        'Accept-Language': 'en-US,en;q=0.9,zh-CN;q=0.8,zh;q=0.7',
+        'Cache-Control': 'max-age=0',
+        # 'Content-Type': 'application/json',
+        # 'Origin': self.base_url,
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)'
+                      ' AppleWebKit/537.36 (KHTML, like Gecko)'
+                      ' Chrome/116.0.0.0 Safari/537.36',
+    })
+
     def __init__(self):
         super().__init__()
         self.__http_client = HttpClient(long_connection=True, verify=True, base_url=self.base_url)
@@ -130,22 +145,20 @@ class Engine(Logging):
         self.info(msg='clearing cookies')
         self.http_client.clear_cookies()
 
+    @property  # protected
+    def default_headers(self) -> dict:
+        """ A new dict for each request, safe to modify """
+        headers = dict(self.COMMON_HEADERS)
+        headers['Referer'] = self.referer_url
+        return headers
+
     async def _http_get(self, url: str, headers: dict = None) -> Optional[str]:
         if headers is None:
-            headers = {
-                'Accept': '*/*',
-                # 'Accept-Encoding': 'gzip, deflate, br',
-                'Accept-Language': 'en-US,en;q=0.9,zh-CN;q=0.8,zh;q=0.7',
-                'Cache-Control': 'max-age=0',
-                # 'Content-Type': 'application/json',
-                # 'Origin': self.base_url,
-                'Referer': self.referer_url,
-                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7)'
-                              ' AppleWebKit/537.36 (KHTML, like Gecko)'
-                              ' Chrome/116.0.0.0 Safari/537.36',
-            }
+            headers = self.default_headers
         try:
-            return self.http_client.cache_get(url=url, headers=headers)
+            # blocking I/O, run it in the executor to let other engines search concurrently
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.http_client.cache_get, url, headers)
         except Exception as error:
             self.error(msg='failed to query url: %s, error: %s' % (url, error))
 
@@ -23,8 +23,10 @@
 # SOFTWARE.
 # ==============================================================================
 
+import asyncio
+import time
 from abc import ABC
-from typing import Optional
+from typing import Optional, Coroutine
 
 from dimples import DateTime
 from dimples import ID
@@ -53,6 +55,8 @@ class ChatBox(ChatContext, Logging, ABC):
         self.__proxy = proxy
         self.__greeted = False
         self.__last_time = DateTime.now()
+        self.__expired = time.monotonic() + self.CHAT_EXPIRES
+        self.__background: Optional[asyncio.Task] = None
 
     @property  # protected
     def facebook(self) -> CommonFacebook:
@@ -81,9 +85,14 @@ class ChatBox(ChatContext, Logging, ABC):
                 name = str(identifier.address)
         return name
 
-    def is_expired(self, now: DateTime) -> bool:
-        expired = self.__last_time + self.CHAT_EXPIRES
-        return now > expired
+    @property
+    def expired_time(self) -> float:
+        """ monotonic time """
+        return self.__expired
+
+    def is_expired(self, now: float) -> bool:
+        """ check with monotonic time """
+        return now > self.__expired
 
     def _refresh_time(self, when: DateTime):
         if when is None:
@@ -97,6 +106,22 @@ class ChatBox(ChatContext, Logging, ABC):
         if when > self.__last_time:
             self.__last_time = when
 
+    #
+    #   Background
+    #
+
+    def _run_background(self, coro: Coroutine) -> asyncio.Task:
+        """ Run coroutine after 'process_request()' returns, the chat client will keep waiting for it """
+        task = asyncio.create_task(coro)
+        self.__background = task
+        return task
+
+    def pop_background(self) -> Optional[asyncio.Task]:
+        """ Get & clear the background task started by last request """
+        task = self.__background
+        self.__background = None
+        return task
+
     #
     #   Request
     #
@@ -104,6 +129,7 @@ class ChatBox(ChatContext, Logging, ABC):
     async def process_request(self, request: Request) -> Optional[ChatProcessor]:
         # refresh last active time
         self._refresh_time(when=request.time)
+        self.__expired = time.monotonic() + self.CHAT_EXPIRES
         # chatting
         if isinstance(request, ChatRequest):
             # question from user
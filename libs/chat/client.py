@@ -23,12 +23,14 @@
 # SOFTWARE.
 # ==============================================================================
 
+import asyncio
+import heapq
+import itertools
 import threading
-import weakref
+import time
 from abc import ABC, abstractmethod
-from typing import Optional, Set
+from typing import Optional, Set, List, Dict, Tuple
 
-from dimples import DateTime
 from dimples import ID
 
 from ..utils import Logging
@@ -41,13 +43,21 @@ from .box import ChatBox
 class ChatClient(Runner, Logging, ABC):
     """ Chat Boxes Pool """
 
+    # max requests processing at the same time
+    MAX_CONCURRENT = 32
+
     def __init__(self):
         super().__init__(interval=Runner.INTERVAL_SLOW)
         self.__lock = threading.Lock()
         self.__requests = []
+        # processing tasks
+        self.__semaphore: Optional[asyncio.Semaphore] = None
+        self.__tasks: Set[asyncio.Task] = set()
+        self.__box_locks: Dict[ID, list] = {}  # ID => [lock, count of requests]
         # boxes pool
-        self.__map = weakref.WeakValueDictionary()  # ID => ChatBox
-        self.__boxes: Set[ChatBox] = set()          # Set[ChatBox]
+        self.__map: Dict[ID, ChatBox] = {}
+        self.__expires: List[Tuple[float, int, ID]] = []  # heap of (expired time, seq, ID)
+        self.__seq = itertools.count()  # tiebreaker, IDs may not be comparable
         self.__next_purge_time = 0
 
     def append(self, request: Request):
@@ -77,11 +87,11 @@ class ChatClient(Runner, Logging, ABC):
                 box = self._new_box(identifier=identifier)
                 if box is not None:
                     self.__map[identifier] = box
-                    self.__boxes.add(box)
+                    heapq.heappush(self.__expires, (box.expired_time, next(self.__seq), identifier))
             return box
 
     def _purge(self) -> int:
-        now = DateTime.now()
+        now = time.monotonic()
         if now < self.__next_purge_time:
             return 0
         else:
@@ -89,31 +99,71 @@ class ChatClient(Runner, Logging, ABC):
         # remove expired box(es)
         count = 0
         with self.__lock:
-            boxes = self.__boxes.copy()
-            for box in boxes:
-                if box.is_expired(now=now):
-                    self.__boxes.discard(box)
+            heap = self.__expires
+            while len(heap) > 0 and heap[0][0] < now:
+                _, _, identifier = heapq.heappop(heap)
+                box = self.__map.get(identifier)
+                if box is None:
+                    continue
+                elif box.is_expired(now=now):
+                    self.__map.pop(identifier, None)
                     count += 1
+                else:
+                    # box refreshed, check it again later
+                    heapq.heappush(heap, (box.expired_time, next(self.__seq), identifier))
         return count
 
+    def _task_done(self, task: asyncio.Task):
+        self.__tasks.discard(task)
+        self.__semaphore.release()
+
+    async def _process_request(self, request: Request) -> bool:
+        # requests for the same box must be processed one by one, in order
+        identifier = request.identifier
+        holder = self.__box_locks.get(identifier)
+        if holder is None:
+            holder = self.__box_locks[identifier] = [asyncio.Lock(), 0]
+        holder[1] += 1
+        background = None
+        try:
+            async with holder[0]:
+                text = await request.build()
+                if text is None:
+                    self.warning(msg='ignore this request: %s' % request)
+                    return True
+                box = self._get_box(identifier=identifier)
+                if box is not None:
+                    # try to process the request
+                    await box.process_request(request=request)
+                    background = box.pop_background()
+                # else:
+                #     assert False, 'failed to get chat box, drop request: %s' % request
+        except Exception as error:
+            self.error(msg='failed to process request: %s, error: %s' % (request, error))
+            return False
+        finally:
+            holder[1] -= 1
+            if holder[1] == 0:
+                self.__box_locks.pop(identifier, None)
+        if background is not None:
+            # the box is free for next request now,
+            # but this processing slot is still taken until the background task done
+            await asyncio.gather(background, return_exceptions=True)
+        return True
+
     # Override
     async def process(self) -> bool:
         request = self._next()
         if request is not None:
-            text = await request.build()
-            if text is None:
-                self.warning(msg='ignore this request: %s' % request)
-                return True
-            box = self._get_box(identifier=request.identifier)
-            if box is not None:
-                # try to process the request
-                try:
-                    await box.process_request(request=request)
-                except Exception as error:
-                    self.error(msg='failed to process request: %s, error: %s' % (request, error))
-                    return False
-            # else:
-            #     assert False, 'failed to get chat box, drop request: %s' % request
+            semaphore = self.__semaphore
+            if semaphore is None:
+                semaphore = self.__semaphore = asyncio.Semaphore(self.MAX_CONCURRENT)
+            # wait for a free slot, then process the request in background,
+            # so that requests for different boxes will not block each other
+            await semaphore.acquire()
+            task = asyncio.create_task(self._process_request(request=request))
+            self.__tasks.add(task)
+            task.add_done_callback(self._task_done)
             return True
         # nothing to do now
         self._purge()
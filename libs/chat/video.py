@@ -124,8 +124,5 @@ def build_season_full(season: Season, index: int, total: int) -> str:
 
 
 def _build_desc(desc: str) -> str:
-    text = ''
     array = desc.strip().splitlines()
-    for line in array:
-        text += '> %s\n' % line
-    return text
+    return ''.join('> %s\n' % line for line in array)
@@ -27,6 +27,7 @@ from typing import Optional, Union, Dict
 
 import requests
 from requests import Response, Session
+from requests.adapters import HTTPAdapter
 from requests.cookies import RequestsCookieJar
 
 from dimples.utils import Log, Logging
@@ -50,6 +51,9 @@ def show_response(response: Response):
 
 class HttpSession:
 
+    # max connections kept alive for each host
+    POOL_SIZE = 32
+
     def __init__(self, long_connection: bool = False, proxies: Dict[str, str] = None, verify: bool = True):
         super().__init__()
         self.__long_connection = long_connection
@@ -62,6 +66,10 @@ class HttpSession:
         network = self.__session
         if network is None:
             network = requests.session()
+            # keep enough connections for concurrent requests
+            adapter = HTTPAdapter(pool_connections=self.POOL_SIZE, pool_maxsize=self.POOL_SIZE)
+            network.mount('http://', adapter)
+            network.mount('https://', adapter)
             self.__session = network
         return network
 
@@ -173,11 +181,22 @@ class HttpClient(Logging):
                 # cache expired, wait to reload
                 holder.renewal(duration=self.CACHE_REFRESHING, now=now)
             # 2. query remote server
-            response = self.http_get(url=url, headers=headers)
+            try:
+                response = self.http_get(url=url, headers=headers)
+            except Exception as error:
+                if holder is None or holder.value is None:
+                    raise error
+                # failover to the expired page
+                self.warning(msg='failed to refresh %s, use cached page, error: %s' % (url, error))
+                return holder.value
             if response.status_code == 200:
                 value = response.text
                 # 3. update memory cache
                 self.__web_cache.update(key=url, value=value, life_span=self.CACHE_EXPIRES, now=now)
+            elif holder is not None and holder.value is not None:
+                # failover to the expired page
+                self.warning(msg='failed to refresh %s, use cached page, code: %d' % (url, response.status_code))
+                value = holder.value
         # OK, return cached value
         return value
 